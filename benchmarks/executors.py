@@ -0,0 +1,80 @@
+"""Benchmark blue's process and thread executors.
+
+Formats a copy of black's own sources with ``blue --check --diff`` using each
+executor and prints the best wall time of a few runs.  Run it with every
+interpreter of interest, e.g. a regular CPython and a free-threaded 3.13t
+build, each with blue installed::
+
+    $ python benchmarks/executors.py --files 2 8 32
+    $ python3.13t benchmarks/executors.py --files 2 8 32
+"""
+
+import argparse
+import pathlib
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def make_corpus(directory, count):
+    """Copy `count` of black's source files into `directory`."""
+    import black
+
+    sources = sorted(pathlib.Path(black.__file__).parent.glob('*.py'))
+    for index in range(count):
+        source = sources[index % len(sources)]
+        shutil.copy(source, directory / f'{index:03}_{source.name}')
+
+
+def run(directory, executor, workers):
+    """Return the wall time of one blue run over `directory`."""
+    command = [
+        sys.executable,
+        '-m',
+        'blue',
+        '--check',
+        '--diff',
+        '--executor',
+        executor,
+        '--workers',
+        str(workers),
+        str(directory),
+    ]
+    start = time.perf_counter()
+    subprocess.run(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, nargs='+', default=[2, 8, 32])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', lambda: True)
+    gil = 'enabled' if is_gil_enabled() else 'disabled'
+    print(
+        f'Python {sys.version.split()[0]}, GIL {gil}, {args.workers} workers'
+    )
+    print(f'{"files":>6} {"process":>10} {"thread":>10}')
+    for count in args.files:
+        with tempfile.TemporaryDirectory() as name:
+            directory = pathlib.Path(name)
+            make_corpus(directory, count)
+            times = [
+                min(
+                    run(directory, executor, args.workers)
+                    for _ in range(args.repeat)
+                )
+                for executor in ('process', 'thread')
+            ]
+        print(f'{count:>6} {times[0]:>9.2f}s {times[1]:>9.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Calibrate when blue should format files in-process rather than in a pool.
+
+Measures how fast this host formats black's own sources in-process and how
+long a process pool takes to start and format its first file.  A pool of `n`
+workers pays off once the work saved, ``(1 - 1/n)`` of the in-process time,
+exceeds its startup time, which gives the break-even for
+``--in-process-bytes``::
+
+    $ python benchmarks/in_process.py
+"""
+
+import argparse
+import multiprocessing
+import os
+import pathlib
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import blue
+import black
+
+
+def corpus():
+    """Return black's own sources as (path, bytes) pairs."""
+    paths = sorted(pathlib.Path(black.__file__).parent.glob('*.py'))
+    return [(path, path.read_bytes()) for path in paths]
+
+
+def throughput(files, mode):
+    """Return the bytes per second formatted in-process."""
+    start = time.perf_counter()
+    for path, data in files:
+        blue.format_file_bytes(path, data, False, mode)
+    return sum(len(data) for _, data in files) / (time.perf_counter() - start)
+
+
+def pool_startup(workers, method, mode):
+    """Return the seconds until a fresh pool formatted its first file."""
+    path = pathlib.Path(blue.__file__).parent / '__main__.py'
+    data = path.read_bytes()
+    context = multiprocessing.get_context(method)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+        futures = [
+            executor.submit(blue.format_file_bytes, path, data, False, mode)
+            for _ in range(workers)
+        ]
+        for future in futures:
+            future.result()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    mode = black.Mode(line_length=79)
+    blue.monkey_patch_black(blue.Mode.synchronous)
+    files = corpus()
+    throughput(files[:2], mode)  # Warm up.
+    rate = throughput(files, mode)
+    print(f'in-process: {rate / 1024:.1f} KiB/s')
+    workers = max(args.workers, 2)
+    for method in multiprocessing.get_all_start_methods():
+        seconds = pool_startup(workers, method, mode)
+        break_even = seconds * rate * workers / (workers - 1)
+        print(
+            f'{method:>10} pool of {workers}: starts in {seconds:.2f}s, '
+            f'pays off above {break_even / 1024:.0f} KiB'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -3,11 +3,31 @@
 Some folks like black but I prefer blue.
 """
 
+import asyncio
+import io
 import logging
+import os
+import pickle
 import re
+import shutil
+import signal
 import sys
-
+import tempfile
+import threading
+import time
+
+from contextlib import contextmanager
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from dataclasses import dataclass, replace
+from datetime import datetime
 from importlib import machinery
+from json import JSONDecodeError
+from multiprocessing import get_start_method
 
 __version__ = '0.9.1'
 
@@ -65,12 +85,30 @@ sys.path_importer_cache.clear()
 import black
 import black.cache
 import black.comments
+import black.parsing
 import black.strings
 
-from black import Leaf, Path, click, token
-from black.cache import user_cache_dir
+from black import (
+    Leaf,
+    Mode as BlackMode,
+    Path,
+    STDIN_PLACEHOLDER,
+    WriteBack,
+    click,
+    decode_bytes,
+    nullcontext,
+    token,
+)
+from black.cache import (
+    Cache,
+    filter_cached,
+    read_cache,
+    user_cache_dir,
+    write_cache,
+)
 from black.comments import ProtoComment, make_comment
-from black.files import tomli
+from black.concurrency import cancel, shutdown
+from black.files import tomli, wrap_stream_for_windows
 from black.linegen import LineGenerator as BlackLineGenerator
 from black.lines import Line
 from black.nodes import (
@@ -79,26 +117,50 @@ from black.nodes import (
     prev_siblings_are,
     syms,
 )
+from black.mode import TargetVersion
+from black.output import color_diff, diff, err, ipynb_diff
+from black.report import Changed, NothingChanged
 from black.strings import (
     STRING_PREFIX_CHARS,
     get_string_prefix,
     normalize_string_prefix,
     sub_twice,
 )
+from blib2to3 import pygram
+from blib2to3.pgen2 import driver
+from blib2to3.pgen2.parse import ParseError
+from blib2to3.pgen2.tokenize import TokenError
+from blib2to3.pytree import Node
+
+from blue.report import REPORT_FORMATS, Report, write_report
 
 from flake8.options import config as flake8_config
 from flake8.options import manager as flake8_manager
 
+from collections import Counter
 from enum import Enum
 from functools import lru_cache
-from typing import Any, Dict, Iterator, List, Optional, Pattern
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    Set,
+    Tuple,
+)
 
 from click.decorators import version_option
 
 
 LOG = logging.getLogger(__name__)
 
-black_format_file_in_place = black.format_file_in_place
+black_get_sources = black.get_sources
+black_lib2to3_parse = black.parsing.lib2to3_parse
+black_check_stability = black.check_stability_and_equivalence
+black_reformat_one = black.reformat_one
 black_strings_fix_docstring = black.strings.fix_docstring
 black_strings_normalize_string_quotes = black.strings.normalize_string_quotes
 
@@ -131,6 +193,12 @@ BLUE_MONKEYPATCHES = [
     (black, 'format_file_in_place', Mode.synchronous),
     (black, 'parse_pyproject_toml', Mode.synchronous),
     (black, 'LineGenerator', Mode.synchronous),
+    (black, 'Report', Mode.synchronous),
+    (black, 'get_sources', Mode.synchronous),
+    (black, 'reformat_one', Mode.synchronous),
+    (black, 'reformat_many', Mode.synchronous),
+    (black, 'lib2to3_parse', Mode.synchronous),
+    (black, 'check_stability_and_equivalence', Mode.synchronous),
     (black.files, 'parse_pyproject_toml', Mode.synchronous),
     (black.linegen, 'normalize_string_quotes', Mode.synchronous),
     (black.strings, 'normalize_string_quotes', Mode.synchronous),
@@ -144,6 +212,8 @@ BLUE_MONKEYPATCHES = [
     (black.trans, 'normalize_string_quotes', Mode.asynchronous),
     (black.comments, 'list_comments', Mode.asynchronous),
     (black.linegen, 'list_comments', Mode.asynchronous),
+    (black, 'lib2to3_parse', Mode.asynchronous),
+    (black, 'check_stability_and_equivalence', Mode.asynchronous),
 ]
 
 
@@ -386,11 +456,795 @@ class LineGenerator(BlackLineGenerator):
 # fmt: on
 
 
-def format_file_in_place(*args, **kws):
+# Blue does its own file I/O around black's formatting.  Sources are read as
+# bytes and handed to the worker which returns the reformatted file already
+# encoded, so that when formatting many files the parent process can read
+# ahead of the workers and a writer thread can write back the results.  Files
+# are written atomically, by way of a temporary file in the same directory,
+# and files whose bytes are unchanged are never rewritten.
+
+READER_THREADS = 4
+
+
+@dataclass
+class FileResult:
+    """The outcome of formatting a single file."""
+
+    changed: bool = False
+    started: float = 0.0
+    seconds: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    worker: str = ''
+    grammar: Optional[str] = None
+    dst: Optional[bytes] = None
+    diff: Optional[str] = None
+    encoding: str = 'utf-8'
+    newline: str = '\n'
+    timeout_phase: Optional[str] = None
+
+
+def format_file_bytes(
+    src: Path,
+    src_bytes: bytes,
+    fast: bool,
+    mode: BlackMode,
+    write_back: WriteBack = WriteBack.NO,
+    timeout: Optional[float] = None,
+) -> FileResult:
+    """Format the contents of the file under `src` path.
+
+    The reformatted file is returned encoded in `FileResult.dst` if
+    `write_back` is YES, and the diff in `FileResult.diff` if it is DIFF or
+    COLOR_DIFF.  Formatting that takes longer than `timeout` seconds is
+    abandoned, and the phase it was in is returned in
+    `FileResult.timeout_phase`.
+    """
     # This is a convenient place to monkey patch any function that must be
     # done after black's asynchronous invocation.
     monkey_patch_black(Mode.asynchronous)
-    return black_format_file_in_place(*args, **kws)
+    started = time.time()
+    start = time.perf_counter()
+    if src.suffix == '.pyi':
+        mode = replace(mode, is_pyi=True)
+    elif src.suffix == '.ipynb':
+        mode = replace(mode, is_ipynb=True)
+
+    result = FileResult(
+        started=started,
+        bytes_in=len(src_bytes),
+        bytes_out=len(src_bytes),
+        worker=f'{os.getpid()}/{threading.current_thread().name}',
+    )
+    _parsing.path = str(src.resolve())
+    _parsing.grammar = None
+    try:
+        with Watchdog(timeout):
+            format_bytes(src, src_bytes, fast, mode, write_back, result)
+    except FileTimeout as exc:
+        result.changed = False
+        result.dst = result.diff = None
+        result.timeout_phase = exc.phase or 'format'
+    finally:
+        result.grammar = _parsing.grammar
+        _parsing.path = None
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def format_bytes(
+    src: Path,
+    src_bytes: bytes,
+    fast: bool,
+    mode: BlackMode,
+    write_back: WriteBack,
+    result: FileResult,
+) -> None:
+    """Format `src_bytes` read from the file under `src` path into
+    `result`.
+    """
+    with phase('decode'):
+        src_contents, encoding, newline = decode_bytes(src_bytes)
+    result.encoding = encoding
+    result.newline = newline
+    try:
+        with phase('linegen'):
+            dst_contents = black.format_file_contents(
+                src_contents, fast=fast, mode=mode
+            )
+    except NothingChanged:
+        return
+    except JSONDecodeError:
+        raise ValueError(
+            f"File '{src}' cannot be parsed as valid Jupyter notebook."
+        ) from None
+
+    if newline != '\n':
+        dst_bytes = dst_contents.replace('\n', newline).encode(encoding)
+    else:
+        dst_bytes = dst_contents.encode(encoding)
+    result.changed = dst_bytes != src_bytes
+    result.bytes_out = len(dst_bytes)
+    if result.changed and write_back is WriteBack.YES:
+        result.dst = dst_bytes
+    elif result.changed and write_back in (
+        WriteBack.DIFF,
+        WriteBack.COLOR_DIFF,
+    ):
+        with phase('diff'):
+            then = datetime.utcfromtimestamp(src.stat().st_mtime)
+            now = datetime.utcnow()
+            src_name = f'{src}\t{then} +0000'
+            dst_name = f'{src}\t{now} +0000'
+            if mode.is_ipynb:
+                diff_contents = ipynb_diff(
+                    src_contents, dst_contents, src_name, dst_name
+                )
+            else:
+                diff_contents = diff(
+                    src_contents, dst_contents, src_name, dst_name
+                )
+            if write_back is WriteBack.COLOR_DIFF:
+                diff_contents = color_diff(diff_contents)
+        result.diff = diff_contents
+
+
+def print_diff(result: FileResult) -> None:
+    """Write the diff in `result` to stdout."""
+    f = io.TextIOWrapper(
+        sys.stdout.buffer,
+        encoding=result.encoding,
+        newline=result.newline,
+        write_through=True,
+    )
+    f = wrap_stream_for_windows(f)
+    f.write(result.diff)
+    f.detach()
+
+
+def write_file(src: Path, contents: bytes, fsync: bool = False) -> None:
+    """Atomically replace the contents of the file under `src` path.
+
+    The contents are written to a temporary file next to `src` which then
+    replaces it, so readers never see a partially written file.  With `fsync`
+    the data is flushed to disk before and after the replacement.
+    """
+    # Write through symlinks rather than replacing them.
+    path = os.path.realpath(src)
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(
+        prefix=f'.{name}.', suffix='.blue', dir=directory
+    )
+    try:
+        with os.fdopen(fd, 'wb') as writer:
+            writer.write(contents)
+            if fsync:
+                writer.flush()
+                os.fsync(writer.fileno())
+        shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def format_file_in_place(
+    src: Path,
+    fast: bool,
+    mode: BlackMode,
+    write_back: WriteBack = WriteBack.NO,
+    lock: Any = None,
+) -> bool:
+    """Format file under `src` path. Return True if changed.
+
+    Like black's version but file I/O goes through blue's atomic writes.
+    """
+    return format_file(src, fast, mode, write_back, lock).changed
+
+
+def format_file(
+    src: Path,
+    fast: bool,
+    mode: BlackMode,
+    write_back: WriteBack = WriteBack.NO,
+    lock: Any = None,
+) -> FileResult:
+    """Format file under `src` path in the current process."""
+    result = format_file_bytes(src, src.read_bytes(), fast, mode, write_back)
+    if result.diff is not None:
+        with lock or nullcontext():
+            print_diff(result)
+    if result.dst is not None:
+        write_file(src, result.dst, fsync=get_option('fsync', False))
+        result.dst = None
+    return result
+
+
+# When formatting many files, black submits them to the process pool in sorted
+# order.  A run then often ends with a single worker still busy on one huge
+# file while every other worker sits idle.  Blue instead schedules the longest
+# jobs first and lets the small files fill in around them.  How long a file
+# takes is remembered between runs in a cost history stored next to the cache;
+# files without any history are estimated from their size.
+
+CostInfo = Tuple[int, float]  # (file size, seconds spent formatting)
+Costs = Dict[str, CostInfo]
+
+
+def get_cost_file() -> Path:
+    return black.cache.CACHE_DIR / 'costs.pickle'
+
+
+def read_pickle(path: Path, default: Any) -> Any:
+    """Read the pickle at `path`, or return `default` if it is missing or not
+    well formed.
+    """
+    if not path.exists():
+        return default
+
+    with path.open('rb') as fobj:
+        try:
+            return pickle.load(fobj)
+        except (pickle.UnpicklingError, ValueError, IndexError, EOFError):
+            return default
+
+
+def write_pickle(path: Path, data: Any) -> None:
+    """Atomically replace the pickle at `path` with `data`."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=str(path.parent), delete=False
+        ) as f:
+            pickle.dump(data, f, protocol=4)
+        os.replace(f.name, path)
+    except OSError:
+        pass
+
+
+def read_costs() -> Costs:
+    """Read the cost history if it exists and is well formed."""
+    return read_pickle(get_cost_file(), {})
+
+
+def write_costs(costs: Costs, timings: Dict[Path, float]) -> None:
+    """Update the cost history with the seconds spent on each file."""
+    new_costs = dict(costs)
+    for src, seconds in timings.items():
+        try:
+            res_src = src.resolve()
+            new_costs[str(res_src)] = (res_src.stat().st_size, seconds)
+        except OSError:
+            continue
+    write_pickle(get_cost_file(), new_costs)
+
+
+def estimate_costs(sources: Iterable[Path], costs: Costs) -> Dict[Path, float]:
+    """Estimate the seconds needed to format each of `sources`.
+
+    Files with history are scaled by how much they grew or shrank since they
+    were last formatted.  Other files are estimated from their size using the
+    median throughput seen in the history, or just by size if there is none.
+    """
+    rates = sorted(
+        seconds / size for size, seconds in costs.values() if size > 0
+    )
+    rate = rates[len(rates) // 2] if rates else 1.0
+    estimates = {}
+    for src in sources:
+        try:
+            res_src = src.resolve()
+            size = res_src.stat().st_size
+        except OSError:
+            estimates[src] = 0.0
+            continue
+        if str(res_src) in costs:
+            old_size, seconds = costs[str(res_src)]
+            estimates[src] = seconds * size / old_size if old_size else seconds
+        else:
+            estimates[src] = rate * size
+    return estimates
+
+
+def order_by_cost(sources: Iterable[Path], costs: Costs) -> List[Path]:
+    """Return `sources` ordered from the most to the least expensive."""
+    estimates = estimate_costs(sources, costs)
+    return sorted(estimates, key=lambda src: (-estimates[src], src))
+
+
+# Without a target version, black tries up to three grammars until one of them
+# parses the file.  Files using newer syntax, like pattern matching, fail to
+# parse at least once every time they're formatted.  Blue remembers which
+# grammar last parsed each file in a memo next to the cache and tries that one
+# first.  Should it no longer parse the file, e.g. because the file changed,
+# the other grammars are tried in black's usual order.  Files that aren't in
+# the memo yet start with the grammar most files needed.
+
+_parsing = threading.local()
+
+
+def get_grammar_file() -> Path:
+    return black.cache.CACHE_DIR / 'grammars.pickle'
+
+
+class GrammarMemo:
+    """The name of the grammar that last parsed each file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.grammars: Dict[str, str] = read_pickle(path, {})
+        counts = Counter(self.grammars.values()).most_common(1)
+        self.default = counts[0][0] if counts else None
+
+    def preferred(self, src: str) -> Optional[str]:
+        """Return the name of the grammar to try first for `src`."""
+        return self.grammars.get(src, self.default)
+
+    def update(self, grammars: Dict[Path, str]) -> None:
+        """Remember the grammar that parsed each file and save the memo."""
+        updates = {}
+        for src, name in grammars.items():
+            res_src = str(src.resolve())
+            if self.grammars.get(res_src) != name:
+                updates[res_src] = name
+        if updates:
+            self.grammars.update(updates)
+            write_pickle(self.path, self.grammars)
+
+
+_grammar_memo: Optional[GrammarMemo] = None
+
+
+def get_grammar_memo() -> GrammarMemo:
+    """Return the grammar memo, reading it once per process."""
+    global _grammar_memo
+    if _grammar_memo is None or _grammar_memo.path != get_grammar_file():
+        _grammar_memo = GrammarMemo(get_grammar_file())
+    return _grammar_memo
+
+
+def lib2to3_parse(
+    src_txt: str, target_versions: Iterable[TargetVersion] = ()
+) -> Node:
+    """Given a string with source, return the lib2to3 Node.
+
+    Like black's version but tries the grammar that last parsed the file being
+    formatted first.
+    """
+    with phase('parse'):
+        return _lib2to3_parse(src_txt, target_versions)
+
+
+def _lib2to3_parse(
+    src_txt: str, target_versions: Iterable[TargetVersion]
+) -> Node:
+    versions = set(target_versions)
+    src = getattr(_parsing, 'path', None)
+    if versions or src is None:
+        return black_lib2to3_parse(src_txt, versions)
+
+    names = {
+        id(grammar): name
+        for name, grammar in vars(pygram).items()
+        if name.startswith('python_grammar')
+    }
+    preferred = get_grammar_memo().preferred(src)
+    grammars = black.parsing.get_grammars(versions)
+    grammars.sort(key=lambda grammar: names.get(id(grammar)) != preferred)
+    text = src_txt if src_txt.endswith('\n') else src_txt + '\n'
+    for grammar in grammars:
+        try:
+            result = driver.Driver(grammar).parse_string(text, True)
+        except (ParseError, TokenError):
+            continue
+        if _parsing.grammar is None:
+            _parsing.grammar = names.get(id(grammar))
+        if isinstance(result, Leaf):
+            result = Node(syms.file_input, [result])
+        return result
+
+    # No grammar parses the file, so let black report the error as usual.
+    return black_lib2to3_parse(src_txt, versions)
+
+
+def check_stability_and_equivalence(
+    src_contents: str, dst_contents: str, *, mode: BlackMode
+) -> None:
+    """Perform stability and equivalence checks.
+
+    Like black's version but runs in the verify phase.
+    """
+    with phase('verify'):
+        black_check_stability(src_contents, dst_contents, mode=mode)
+
+
+# Some inputs, like deeply nested literals or very long chained expressions in
+# generated code, make black's line splitting take minutes.  With
+# --file-timeout, a watchdog timer interrupts the worker formatting such a file
+# by raising `FileTimeout` in its thread, which works the same in worker
+# processes, worker threads and in-process.  The exception is only raised once
+# the worker runs Python code again, which black, not being compiled with
+# mypyc under blue, does all the time.  Formatting is split into phases so that
+# a timeout can say what the file was stuck on.
+
+try:
+    import ctypes
+
+    _set_async_exc = ctypes.pythonapi.PyThreadState_SetAsyncExc
+    _set_async_exc.argtypes = (ctypes.c_ulong, ctypes.py_object)
+except (ImportError, AttributeError):
+    # Not CPython, so files can't be interrupted.
+    _set_async_exc = None
+
+
+class FileTimeout(BaseException):
+    """Formatting a file took longer than --file-timeout.
+
+    This is a BaseException so that black's handlers for errors in the code
+    being formatted don't catch it.
+    """
+
+    phase: Optional[str] = None
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Run the body as the phase of formatting called `name`."""
+    try:
+        yield
+    except FileTimeout as exc:
+        if exc.phase is None:
+            exc.phase = name
+        raise
+
+
+class Watchdog:
+    """Interrupt the current thread with `FileTimeout` after `seconds`."""
+
+    def __init__(self, seconds: Optional[float]) -> None:
+        self.seconds = seconds
+        self.thread_id = threading.get_ident()
+        self.lock = threading.Lock()
+        self.timer: Optional[threading.Timer] = None
+        self.finished = False
+        self.fired = False
+
+    def interrupt(self) -> None:
+        with self.lock:
+            if not self.finished:
+                self.fired = True
+                self.set_async_exc(FileTimeout)
+
+    def set_async_exc(self, exc: Any) -> None:
+        assert _set_async_exc is not None
+        _set_async_exc(self.thread_id, exc)
+
+    def __enter__(self) -> 'Watchdog':
+        if self.seconds is not None and _set_async_exc is not None:
+            self.timer = threading.Timer(self.seconds, self.interrupt)
+            self.timer.daemon = True
+            self.timer.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self.timer is None:
+            return
+        with self.lock:
+            self.finished = True
+            self.timer.cancel()
+            if self.fired:
+                # Don't leave the exception pending should the body have
+                # finished before it was raised.
+                self.set_async_exc(ctypes.py_object())
+        if self.fired and exc_info[0] is None:
+            raise FileTimeout
+
+
+# Blue's patches are process-global, so a pool of threads shares them for free
+# and avoids starting processes that each re-import pure-Python black.  With
+# the GIL threads don't format in parallel, but on free-threaded builds of
+# CPython they do.  And for a handful of small files, like a typical
+# pre-commit run, starting any pool takes longer than formatting the files
+# in-process, with the patches `main()` already applied.
+
+EXECUTORS = ('auto', 'in-process', 'process', 'thread')
+
+# The total size of the files below which a pool of two workers costs more to
+# start than it saves, by multiprocessing start method.  Calibrated with
+# benchmarks/in_process.py.
+IN_PROCESS_BYTES = {
+    'fork': 4 * 1024,
+    'forkserver': 32 * 1024,
+    'spawn': 48 * 1024,
+}
+
+
+class InProcessExecutor(Executor):
+    """Executor that runs every call right away in the calling thread."""
+
+    def submit(self, fn, *args, **kwargs):
+        future: Future = Future()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as exc:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+        return future
+
+
+def is_free_threaded() -> bool:
+    """Return whether the GIL is disabled, e.g. on CPython 3.13t."""
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def choose_executor(executor: str, sources: Iterable[Path]) -> str:
+    """Return which kind of executor to use to format `sources`.
+
+    With auto, files are formatted in-process when there are at most
+    --in-process-files of them or they total at most --in-process-bytes.
+    """
+    if executor != 'auto':
+        return executor
+    sources = list(sources)
+    max_files = get_option('in_process_files', 1)
+    max_bytes = get_option('in_process_bytes', None)
+    if max_bytes is None:
+        max_bytes = IN_PROCESS_BYTES.get(get_start_method(), 0)
+    if len(sources) <= max_files or total_size(sources) <= max_bytes:
+        return 'in-process'
+    if is_free_threaded():
+        return 'thread'
+    return 'process'
+
+
+def total_size(sources: Iterable[Path]) -> int:
+    """Return the total size of `sources` in bytes."""
+    size = 0
+    for src in sources:
+        try:
+            size += src.stat().st_size
+        except OSError:
+            pass
+    return size
+
+
+def make_executor(kind: str, workers: int) -> Executor:
+    """Return a new executor of the given `kind`."""
+    if kind == 'in-process':
+        return InProcessExecutor()
+    if kind == 'thread':
+        return ThreadPoolExecutor(max_workers=workers)
+    try:
+        return ProcessPoolExecutor(max_workers=workers)
+    except (ImportError, NotImplementedError, OSError):
+        # Same fallback as black: the system doesn't support multiprocessing.
+        return ThreadPoolExecutor(max_workers=1)
+
+
+def terminate(executor: Executor) -> None:
+    """Shut down `executor` without waiting for the work in progress.
+
+    Worker processes are killed.  Threads can't be, so those still finish the
+    file they're working on.
+    """
+    if sys.version_info >= (3, 9):
+        executor.shutdown(wait=False, cancel_futures=True)
+    else:
+        executor.shutdown(wait=False)
+    processes = getattr(executor, '_processes', None) or {}
+    for process in list(processes.values()):
+        process.terminate()
+
+
+def reformat_one(
+    src: Path,
+    fast: bool,
+    write_back: WriteBack,
+    mode: BlackMode,
+    report: Report,
+) -> None:
+    """Reformat a single file under `src`.
+
+    Files go through `reformat_many()` like any other batch, which formats
+    them in-process by default.  Standard input is left to black.
+    """
+    if str(src) == '-' or str(src).startswith(STDIN_PLACEHOLDER):
+        black_reformat_one(src, fast, write_back, mode, report)
+    else:
+        reformat_many({src}, fast, write_back, mode, report, workers=None)
+
+
+def reformat_many(
+    sources: Set[Path],
+    fast: bool,
+    write_back: WriteBack,
+    mode: BlackMode,
+    report: Report,
+    workers: Optional[int],
+) -> None:
+    """Reformat multiple files in-process, or with a ProcessPoolExecutor or
+    ThreadPoolExecutor, depending on the --executor option.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    worker_count = workers if workers is not None else black.DEFAULT_WORKERS
+    if sys.platform == 'win32':
+        # Work around https://bugs.python.org/issue26903
+        assert worker_count is not None
+        worker_count = min(worker_count, 60)
+    try:
+        with measure('formatting'):
+            loop.run_until_complete(
+                schedule_formatting(
+                    sources=sources,
+                    fast=fast,
+                    write_back=write_back,
+                    mode=mode,
+                    report=report,
+                    loop=loop,
+                    workers=worker_count,
+                )
+            )
+    finally:
+        try:
+            shutdown(loop)
+        finally:
+            asyncio.set_event_loop(None)
+
+
+async def schedule_formatting(
+    sources: Set[Path],
+    fast: bool,
+    write_back: WriteBack,
+    mode: BlackMode,
+    report: Report,
+    loop: asyncio.AbstractEventLoop,
+    workers: int,
+) -> None:
+    """Run formatting of `sources` with an executor of up to `workers`.
+
+    Like black's version, but the most expensive files are submitted first,
+    or the cheapest with --fail-fast, and the time spent on each file is
+    recorded in the cost history.  Up to two files per worker are read and
+    queued at any time, and reformatted files are written back from a single
+    writer thread.  Files that time out are skipped, and the executor whose
+    worker was interrupted is replaced by a fresh one.
+    """
+    cache: Cache = {}
+    if write_back not in (WriteBack.DIFF, WriteBack.COLOR_DIFF):
+        cache = read_cache(mode)
+        sources, cached = filter_cached(cache, sources)
+        for src in sorted(cached):
+            report.done(src, Changed.CACHED)
+    if not sources:
+        return
+
+    cancelled = []
+    sources_to_cache = []
+    timings: Dict[Path, float] = {}
+    grammars: Dict[Path, str] = {}
+    started = []
+    costs = read_costs()
+    fsync = get_option('fsync', False)
+    fail_fast = get_option('fail_fast', False)
+    timeout = get_option('file_timeout', None)
+    kind = choose_executor(get_option('executor', 'auto'), sources)
+    created = time.time()
+    executor = make_executor(kind, workers)
+    retired: List[Executor] = []
+    window = asyncio.Semaphore(2 * workers)
+    reader = ThreadPoolExecutor(max_workers=READER_THREADS)
+    writer = ThreadPoolExecutor(max_workers=1)
+
+    async def process(src: Path) -> FileResult:
+        async with window:
+            src_bytes = await loop.run_in_executor(reader, src.read_bytes)
+            result = await loop.run_in_executor(
+                executor,
+                format_file_bytes,
+                src,
+                src_bytes,
+                fast,
+                mode,
+                write_back,
+                timeout,
+            )
+            if result.dst is not None:
+                await loop.run_in_executor(
+                    writer, write_file, src, result.dst, fsync
+                )
+                result.dst = None
+            return result
+
+    order = order_by_cost(sources, costs)
+    if fail_fast:
+        # Get to a verdict on as many files as possible early on.
+        order.reverse()
+    tasks = {asyncio.ensure_future(process(src)): src for src in order}
+    pending = tasks.keys()
+    try:
+        loop.add_signal_handler(signal.SIGINT, cancel, pending)
+        loop.add_signal_handler(signal.SIGTERM, cancel, pending)
+    except NotImplementedError:
+        # There are no good alternatives for these on Windows.
+        pass
+    try:
+        while pending:
+            done, _ = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                src = tasks.pop(task)
+                if task.cancelled():
+                    cancelled.append(task)
+                elif task.exception():
+                    report.failed(src, str(task.exception()))
+                else:
+                    result = task.result()
+                    timings[src] = result.seconds
+                    started.append(result.started)
+                    if result.grammar is not None:
+                        grammars[src] = result.grammar
+                    if result.timeout_phase is not None:
+                        report.timed_out(src, result)
+                        # The files already queued finish in the old pool.
+                        executor.shutdown(wait=False)
+                        retired.append(executor)
+                        executor = make_executor(kind, workers)
+                        continue
+                    if result.diff is not None:
+                        print_diff(result)
+                    changed = Changed.YES if result.changed else Changed.NO
+                    # If the file was written back or was successfully
+                    # checked as well-formatted, store this information in
+                    # the cache.
+                    if write_back is WriteBack.YES or (
+                        write_back is WriteBack.CHECK and changed is Changed.NO
+                    ):
+                        sources_to_cache.append(src)
+                    report.done(src, changed, result)
+            if fail_fast and report.return_code:
+                # The run fails anyway, so don't start on any other files.
+                for task in pending:
+                    task.cancel()
+                if not report.quiet:
+                    err('Stopped early because of --fail-fast.')
+                break
+        if cancelled:
+            await asyncio.gather(*cancelled, return_exceptions=True)
+    finally:
+        reader.shutdown()
+        writer.shutdown()
+        for pool in retired + [executor]:
+            if fail_fast and report.return_code:
+                terminate(pool)
+            else:
+                pool.shutdown()
+    if started and kind != 'in-process':
+        record_timing('pool_startup', min(started) - created)
+    if sources_to_cache:
+        write_cache(cache, sources_to_cache, mode)
+    if timings:
+        write_costs(costs, timings)
+    if grammars:
+        get_grammar_memo().update(grammars)
+
+
+def get_sources(**kwargs: Any) -> Set[Path]:
+    """Compute the set of files to be formatted, timing the discovery."""
+    with measure('discovery'):
+        return black_get_sources(**kwargs)
 
 
 try:
@@ -414,6 +1268,13 @@ def read_configs(
     ctx: click.Context, param: click.Parameter, value: Optional[str]
 ) -> Optional[str]:
     """Read configs through the config param's callback hook."""
+    with measure('config'):
+        return _read_configs(ctx, param, value)
+
+
+def _read_configs(
+    ctx: click.Context, param: click.Parameter, value: Optional[str]
+) -> Optional[str]:
     # Use black's `read_pyproject_toml` for the default
     result = black.read_pyproject_toml(ctx, param, value)
     # Use flake8's config file parsing to load setup.cfg, tox.ini, and .blue
@@ -432,6 +1293,144 @@ def read_configs(
     return result
 
 
+# Blue's own command line options are added to black's.  Their values can't be
+# passed to black's main(), so instead they're stashed in the Click context
+# where blue's patches look them up.
+
+
+def store_option(
+    ctx: click.Context, param: click.Parameter, value: Any
+) -> Any:
+    """Store the value of one of blue's options in the Click context."""
+    ctx.ensure_object(dict)[param.name] = value
+    return value
+
+
+def get_option(name: str, default: Any = None) -> Any:
+    """Return the value of one of blue's options for the current run."""
+    ctx = click.get_current_context(silent=True)
+    if ctx is None or not isinstance(ctx.obj, dict):
+        return default
+    return ctx.obj.get(name, default)
+
+
+def record_timing(name: str, seconds: float) -> None:
+    """Add `seconds` to the timing called `name` for the current run."""
+    ctx = click.get_current_context(silent=True)
+    if ctx is not None:
+        timings = ctx.ensure_object(dict).setdefault('timings', {})
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def measure(name: str) -> Iterator[None]:
+    """Record the time spent in the block as the timing called `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start)
+
+
+def report_option(
+    ctx: click.Context, param: click.Parameter, value: Any
+) -> Any:
+    """Write the run's report once black is done, if one was asked for."""
+    if value:
+        fmt, path = value
+
+        def write_run_report() -> None:
+            report = ctx.obj.get('report')
+            if report is not None:
+                write_report(report, ctx.obj.get('timings', {}), fmt, path)
+
+        ctx.call_on_close(write_run_report)
+    return store_option(ctx, param, value)
+
+
+BLUE_OPTIONS = [
+    click.Option(
+        ['--fsync/--no-fsync'],
+        default=False,
+        expose_value=False,
+        callback=store_option,
+        help=(
+            'Flush reformatted files to disk before moving on. Safer on '
+            'power loss but slower, especially on networked filesystems.'
+        ),
+    ),
+    click.Option(
+        ['--executor'],
+        type=click.Choice(EXECUTORS),
+        default='auto',
+        expose_value=False,
+        callback=store_option,
+        help=(
+            'Format files in-process, or in worker processes or threads. By '
+            'default, small batches are formatted in-process, and threads are '
+            'used for larger ones on free-threaded Python builds.'
+        ),
+    ),
+    click.Option(
+        ['--in-process-files'],
+        type=click.IntRange(min=0),
+        default=1,
+        show_default=True,
+        expose_value=False,
+        callback=store_option,
+        help=(
+            'With --executor=auto, format this many files or fewer in-process '
+            'rather than starting a pool.'
+        ),
+    ),
+    click.Option(
+        ['--in-process-bytes'],
+        type=click.IntRange(min=0),
+        default=None,
+        expose_value=False,
+        callback=store_option,
+        help=(
+            'With --executor=auto, format files totalling this many bytes or '
+            'fewer in-process rather than starting a pool. Defaults to what '
+            'pays off with the multiprocessing start method in use.'
+        ),
+    ),
+    click.Option(
+        ['--file-timeout'],
+        type=click.FloatRange(min=0, min_open=True),
+        metavar='SECONDS',
+        expose_value=False,
+        callback=store_option,
+        help=(
+            'Skip files that take longer than SECONDS to format, e.g. '
+            'generated code that is very slow to split into lines.'
+        ),
+    ),
+    click.Option(
+        ['--fail-fast'],
+        is_flag=True,
+        expose_value=False,
+        callback=store_option,
+        help=(
+            'Stop at the first file that fails the run, e.g. one that would '
+            'be reformatted with --check, without formatting any others.'
+        ),
+    ),
+    click.Option(
+        ['--report'],
+        type=(click.Choice(REPORT_FORMATS), click.Path(dir_okay=False)),
+        default=None,
+        expose_value=False,
+        callback=report_option,
+        metavar='[json|junit] FILE',
+        help=(
+            'Write a report of the run to FILE, with the status, timing and '
+            'size of every file.'
+        ),
+    ),
+]
+
+
 def main():
     monkey_patch_black(Mode.synchronous)
     # Reach in and monkey patch the Click options. This is tricky based on the
@@ -456,4 +1455,8 @@ def main():
     # precedence over the existing one.
     version_string = f'{__version__}, based on black {black.__version__}'
     version_option(version_string)(black.main)
+    # Add blue's own options.
+    for option in BLUE_OPTIONS:
+        if option not in black.main.params:
+            black.main.params.append(option)
     black.main()
@@ -0,0 +1,207 @@
+"""Machine-readable reports of blue runs.
+
+Black only summarizes a run for humans.  Blue's `Report` additionally keeps a
+record of every file it was told about, which can be written out as JSON or
+as JUnit XML together with timings for the whole run.
+"""
+
+import json
+import platform
+
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from xml.etree import ElementTree
+
+from black import __version__ as black_version, click
+from black.output import err
+from black.report import Changed, Report as BlackReport
+
+from blue import __version__
+
+
+REPORT_FORMATS = ('json', 'junit')
+
+UNCHANGED = 'unchanged'
+REFORMATTED = 'reformatted'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+@dataclass
+class FileRecord:
+    """What happened to a single file during a run."""
+
+    path: str
+    status: str
+    seconds: Optional[float] = None
+    bytes_in: Optional[int] = None
+    bytes_out: Optional[int] = None
+    cache_hit: bool = False
+    worker: Optional[str] = None
+    message: Optional[str] = None
+    phase: Optional[str] = None
+
+
+@dataclass
+class Report(BlackReport):
+    """Black's reformatting counter which also records every file."""
+
+    timeout_count: int = 0
+    files: List[FileRecord] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        # Let blue find the report of the current run when it's done.
+        ctx = click.get_current_context(silent=True)
+        if ctx is not None:
+            ctx.ensure_object(dict)['report'] = self
+
+    def done(self, src: Path, changed: Changed, result: Any = None) -> None:
+        """Increment the counter for successful reformatting and record the
+        file.  `result` is the `blue.FileResult` from formatting it, if any.
+        """
+        super().done(src, changed)
+        record = FileRecord(
+            path=str(src),
+            status=REFORMATTED if changed is Changed.YES else UNCHANGED,
+            cache_hit=changed is Changed.CACHED,
+        )
+        if result is not None:
+            record.seconds = result.seconds
+            record.bytes_in = result.bytes_in
+            record.bytes_out = result.bytes_out
+            record.worker = result.worker
+        elif changed is Changed.CACHED:
+            try:
+                record.bytes_in = record.bytes_out = src.stat().st_size
+            except OSError:
+                pass
+        self.files.append(record)
+
+    def failed(self, src: Path, message: str) -> None:
+        """Increment the counter for failed reformatting and record the
+        file.
+        """
+        super().failed(src, message)
+        self.files.append(
+            FileRecord(path=str(src), status=FAILED, message=message)
+        )
+
+    def timed_out(self, src: Path, result: Any) -> None:
+        """Increment the counter for files that took longer than
+        --file-timeout, and record the file together with the phase it timed
+        out in.
+        """
+        err(f'skipped {src}: timeout in {result.timeout_phase}')
+        self.timeout_count += 1
+        self.files.append(
+            FileRecord(
+                path=str(src),
+                status=SKIPPED,
+                seconds=result.seconds,
+                bytes_in=result.bytes_in,
+                worker=result.worker,
+                message='timeout',
+                phase=result.timeout_phase,
+            )
+        )
+
+    def path_ignored(self, path: Path, message: str) -> None:
+        super().path_ignored(path, message)
+        self.files.append(
+            FileRecord(path=str(path), status=SKIPPED, message=message)
+        )
+
+    def __str__(self) -> str:
+        report = super().__str__()
+        if self.timeout_count:
+            s = 's' if self.timeout_count > 1 else ''
+            timed_out = click.style(
+                f'{self.timeout_count} file{s} skipped after timing out',
+                fg='yellow',
+            )
+            if report == '.':
+                report = f'{timed_out}.'
+            else:
+                report = f'{report[:-1]}, {timed_out}.'
+        return report
+
+    def totals(self) -> Dict[str, int]:
+        """Return the number of files by status."""
+        totals = dict.fromkeys((UNCHANGED, REFORMATTED, FAILED, SKIPPED), 0)
+        for record in self.files:
+            totals[record.status] += 1
+        totals['cache_hits'] = sum(record.cache_hit for record in self.files)
+        totals['files'] = len(self.files)
+        return totals
+
+
+def report_json(report: Report, timings: Dict[str, float]) -> str:
+    """Render `report` and the run's `timings` as a JSON document."""
+    document = {
+        'blue_version': __version__,
+        'black_version': black_version,
+        'python_version': platform.python_version(),
+        'check': report.check or report.diff,
+        'return_code': report.return_code,
+        'totals': report.totals(),
+        'timings': timings,
+        'files': [asdict(record) for record in report.files],
+    }
+    return json.dumps(document, indent=2) + '\n'
+
+
+def report_junit(report: Report, timings: Dict[str, float]) -> str:
+    """Render `report` and the run's `timings` as a JUnit XML document.
+
+    Every file is a test case.  Files that fail to format are errors and, when
+    checking, files that would be reformatted are failures.
+    """
+    totals = report.totals()
+    check = report.check or report.diff
+    suite = ElementTree.Element(
+        'testsuite',
+        name='blue',
+        tests=str(totals['files']),
+        failures=str(totals[REFORMATTED] if check else 0),
+        errors=str(totals[FAILED]),
+        skipped=str(totals[SKIPPED]),
+        time=f'{sum(timings.values()):.6f}',
+    )
+    properties = ElementTree.SubElement(suite, 'properties')
+    for name, seconds in sorted(timings.items()):
+        ElementTree.SubElement(
+            properties,
+            'property',
+            name=f'{name}_seconds',
+            value=f'{seconds:.6f}',
+        )
+    for record in report.files:
+        case = ElementTree.SubElement(
+            suite,
+            'testcase',
+            classname='blue',
+            name=record.path,
+            time=f'{record.seconds or 0.0:.6f}',
+        )
+        if record.status == FAILED:
+            ElementTree.SubElement(case, 'error', message=record.message or '')
+        elif record.status == SKIPPED:
+            ElementTree.SubElement(
+                case, 'skipped', message=record.message or ''
+            )
+        elif record.status == REFORMATTED and check:
+            ElementTree.SubElement(case, 'failure', message='would reformat')
+        output = ElementTree.SubElement(case, 'system-out')
+        output.text = json.dumps(asdict(record))
+    suites = ElementTree.Element('testsuites')
+    suites.append(suite)
+    return ElementTree.tostring(suites, encoding='unicode') + '\n'
+
+
+def write_report(
+    report: Report, timings: Dict[str, float], fmt: str, path: str
+) -> None:
+    """Write `report` in the format named `fmt` to the file at `path`."""
+    render = report_json if fmt == 'json' else report_junit
+    Path(path).write_text(render(report, timings), encoding='utf-8')
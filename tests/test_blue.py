@@ -1,14 +1,21 @@
 import asyncio
+import json
+import os
 import pathlib
+import stat
 
 # blue must be imported before black.  See GH#72.
 import blue
 import black
 import pytest
 
+from blib2to3 import pygram
+from blib2to3.pgen2 import driver
+
 from contextlib import ExitStack
 from shutil import copy
 from tempfile import TemporaryDirectory
+from xml.etree import ElementTree
 
 
 tests_dir = pathlib.Path(__file__).parent.absolute()
@@ -88,3 +95,260 @@ def test_version(capsys, monkeypatch):
     version = f'blue, version {blue.__version__}, based on black {black.__version__}\n'
     assert out.endswith(version)
     assert err == ''
+
+
+def test_order_by_cost(tmp_path):
+    small, large, slow = (tmp_path / name for name in ('s.py', 'l.py', 'x.py'))
+    small.write_text('a = 1\n')
+    large.write_text('a = 1\n' * 100)
+    slow.write_text('a = 1\n' * 10)
+    # Without any history, files are ordered by size.
+    assert blue.order_by_cost([small, large, slow], {}) == [large, slow, small]
+    # History wins over size.
+    costs = {str(slow.resolve()): (60, 5.0), str(large.resolve()): (600, 1.0)}
+    assert blue.order_by_cost([small, large, slow], costs) == [
+        slow,
+        large,
+        small,
+    ]
+
+
+def test_cost_history(monkeypatch, tmp_path):
+    monkeypatch.setattr('black.cache.CACHE_DIR', tmp_path / 'cache')
+    assert blue.read_costs() == {}
+    src = tmp_path / 'example.py'
+    src.write_text('a = 1\n')
+    blue.write_costs({'other.py': (1, 2.0)}, {src: 0.5})
+    assert blue.read_costs() == {
+        'other.py': (1, 2.0),
+        str(src.resolve()): (6, 0.5),
+    }
+    blue.get_cost_file().write_bytes(b'garbage')
+    assert blue.read_costs() == {}
+
+
+def test_format_file_bytes(tmp_path):
+    src = tmp_path / 'example.py'
+    mode = black.Mode(line_length=79)
+    result = blue.format_file_bytes(
+        src, b'x = "a"\r\n', True, mode, black.WriteBack.YES
+    )
+    assert result.changed
+    assert result.dst == b"x = 'a'\r\n"
+    result = blue.format_file_bytes(
+        src, b"x = 'a'\n", True, mode, black.WriteBack.YES
+    )
+    assert not result.changed
+    assert result.dst is None
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason='requires symlinks')
+def test_write_file(tmp_path):
+    target = tmp_path / 'target.py'
+    target.write_bytes(b'a=1\n')
+    target.chmod(0o755)
+    link = tmp_path / 'link.py'
+    link.symlink_to(target)
+    blue.write_file(link, b'a = 1\n', fsync=True)
+    assert link.is_symlink()
+    assert target.read_bytes() == b'a = 1\n'
+    assert stat.S_IMODE(target.stat().st_mode) == 0o755
+    assert sorted(tmp_path.iterdir()) == [link, target]
+
+
+@pytest.mark.parametrize('fmt', ['json', 'junit'])
+def test_report(monkeypatch, tmp_path, fmt):
+    (tmp_path / 'good.py').write_text("a = 'a'\n")
+    (tmp_path / 'bad.py').write_text('a = "a"\n')
+    report_path = tmp_path / 'report.out'
+    monkeypatch.setattr(
+        'sys.argv',
+        ['blue', '--check', '--report', fmt, str(report_path), '.'],
+    )
+    monkeypatch.chdir(tmp_path)
+    black.find_project_root.cache_clear()
+    with pytest.raises(SystemExit) as exc_info:
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        blue.main()
+    monkeypatch.chdir(tests_dir)
+    assert exc_info.value.code == 1
+    if fmt == 'json':
+        report = json.loads(report_path.read_text())
+        assert report['totals']['reformatted'] == 1
+        assert report['totals']['unchanged'] == 1
+        assert {'config', 'discovery', 'formatting'} <= set(report['timings'])
+        statuses = {record['path']: record for record in report['files']}
+        assert statuses['bad.py']['status'] == 'reformatted'
+        assert statuses['bad.py']['bytes_in'] == 8
+        assert statuses['good.py']['status'] == 'unchanged'
+    else:
+        suite = ElementTree.parse(str(report_path)).find('testsuite')
+        assert suite.get('tests') == '2'
+        assert suite.get('failures') == '1'
+
+
+def test_grammar_memo(monkeypatch, tmp_path):
+    monkeypatch.setattr('black.cache.CACHE_DIR', tmp_path / 'cache')
+    mode = black.Mode(line_length=79)
+    src = tmp_path / 'example.py'
+    src.write_text('match x:\n    case 1:\n        pass\n')
+    result = blue.format_file_bytes(src, src.read_bytes(), False, mode)
+    assert result.grammar == 'python_grammar_soft_keywords'
+    blue.get_grammar_memo().update({src: result.grammar})
+
+    attempts = []
+    parse_string = driver.Driver.parse_string
+
+    def counting_parse_string(self, *args, **kws):
+        attempts.append(self.grammar)
+        return parse_string(self, *args, **kws)
+
+    monkeypatch.setattr(driver.Driver, 'parse_string', counting_parse_string)
+    blue.format_file_bytes(src, src.read_bytes(), False, mode)
+    assert attempts == [pygram.python_grammar_soft_keywords]
+
+    # The file changed and needs another grammar now.
+    attempts.clear()
+    src.write_text('async = 1\n')
+    result = blue.format_file_bytes(src, src.read_bytes(), False, mode)
+    assert len(attempts) == 3
+    assert result.grammar == (
+        'python_grammar_no_print_statement_no_exec_statement'
+    )
+
+
+def test_choose_executor(monkeypatch, tmp_path):
+    sources = []
+    for name in 'abc':
+        path = tmp_path / f'{name}.py'
+        path.write_text('x = 1\n' * 1000)
+        sources.append(path)
+    assert blue.choose_executor('process', sources[:1]) == 'process'
+    assert blue.choose_executor('thread', sources) == 'thread'
+    assert blue.choose_executor('auto', sources[:1]) == 'in-process'
+    monkeypatch.setattr('sys._is_gil_enabled', lambda: True, raising=False)
+    assert blue.choose_executor('auto', sources) == 'process'
+    monkeypatch.setattr('sys._is_gil_enabled', lambda: False, raising=False)
+    assert blue.choose_executor('auto', sources) == 'thread'
+
+
+def test_choose_executor_in_process(monkeypatch, tmp_path):
+    sources = [tmp_path / 'a.py', tmp_path / 'b.py']
+    for path in sources:
+        path.write_text('x = 1\n' * 1000)
+    monkeypatch.setattr('sys._is_gil_enabled', lambda: True, raising=False)
+    monkeypatch.setattr(blue, 'get_start_method', lambda: 'spawn')
+    assert blue.choose_executor('auto', sources) == 'in-process'
+    monkeypatch.setattr(blue, 'get_start_method', lambda: 'fork')
+    assert blue.choose_executor('auto', sources) == 'process'
+    assert blue.total_size(sources) == 12000
+    assert blue.total_size([tmp_path / 'missing.py']) == 0
+
+
+@pytest.mark.parametrize('executor', ['in-process', 'process', 'thread'])
+def test_executor(monkeypatch, tmp_path, executor):
+    (tmp_path / 'one.py').write_text('a = "a"\n')
+    (tmp_path / 'two.py').write_text('b = "b"\n')
+    monkeypatch.setattr('sys.argv', ['blue', '--executor', executor, '.'])
+    monkeypatch.chdir(tmp_path)
+    black.find_project_root.cache_clear()
+    with pytest.raises(SystemExit) as exc_info:
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        blue.main()
+    monkeypatch.chdir(tests_dir)
+    assert exc_info.value.code == 0
+    assert (tmp_path / 'one.py').read_text() == "a = 'a'\n"
+    assert (tmp_path / 'two.py').read_text() == "b = 'b'\n"
+
+
+def test_fail_fast(monkeypatch, tmp_path):
+    for index in range(8):
+        (tmp_path / f'example{index}.py').write_text('a = "a"\n')
+    report_path = tmp_path / 'report.json'
+    monkeypatch.setattr(
+        'sys.argv',
+        [
+            'blue',
+            '--check',
+            '--fail-fast',
+            '--executor',
+            'process',
+            '--workers',
+            '1',
+            '--report',
+            'json',
+            str(report_path),
+            '.',
+        ],
+    )
+    monkeypatch.chdir(tmp_path)
+    black.find_project_root.cache_clear()
+    with pytest.raises(SystemExit) as exc_info:
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        blue.main()
+    monkeypatch.chdir(tests_dir)
+    assert exc_info.value.code == 1
+    report = json.loads(report_path.read_text())
+    assert 1 <= report['totals']['reformatted'] < 8
+
+
+def spin(src_contents, mode):
+    with blue.phase('linegen'):
+        while True:
+            pass
+
+
+def test_format_file_bytes_timeout(monkeypatch, tmp_path):
+    src = tmp_path / 'example.py'
+    src.write_text('a = "a"\n')
+    monkeypatch.setattr(black, 'format_str', spin)
+    result = blue.format_file_bytes(
+        src, b'a = "a"\n', False, black.Mode(), black.WriteBack.YES, 0.1
+    )
+    assert result.timeout_phase == 'linegen'
+    assert not result.changed
+    assert result.dst is None
+    assert result.seconds >= 0.1
+
+
+@pytest.mark.parametrize('executor', ['in-process', 'thread'])
+def test_file_timeout(monkeypatch, tmp_path, executor):
+    def format_str(src_contents, mode):
+        if 'slow' in src_contents:
+            spin(src_contents, mode)
+        return black_format_str(src_contents, mode=mode)
+
+    black_format_str = black.format_str
+    monkeypatch.setattr(black, 'format_str', format_str)
+    (tmp_path / 'fast.py').write_text('a = "fast"\n')
+    (tmp_path / 'slow.py').write_text('a = "slow"\n')
+    report_path = tmp_path / 'report.json'
+    monkeypatch.setattr(
+        'sys.argv',
+        [
+            'blue',
+            '--file-timeout',
+            '0.5',
+            '--executor',
+            executor,
+            '--report',
+            'json',
+            str(report_path),
+            '.',
+        ],
+    )
+    monkeypatch.chdir(tmp_path)
+    black.find_project_root.cache_clear()
+    with pytest.raises(SystemExit) as exc_info:
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        blue.main()
+    monkeypatch.chdir(tests_dir)
+    assert exc_info.value.code == 0
+    assert (tmp_path / 'fast.py').read_text() == "a = 'fast'\n"
+    assert (tmp_path / 'slow.py').read_text() == 'a = "slow"\n'
+    report = json.loads(report_path.read_text())
+    assert report['totals']['skipped'] == 1
+    (record,) = [r for r in report['files'] if r['path'] == 'slow.py']
+    assert record['status'] == 'skipped'
+    assert record['message'] == 'timeout'
+    assert record['phase'] == 'linegen'